@@ -1,11 +1,23 @@
+import io
 import os
+import re
+import asyncio
+import hashlib
+import functools
 import uuid
 import time
 import tempfile
+import wave
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict
+from typing import Callable, Iterator, List, Dict, Optional
 
+import duckdb
+import numpy as np
+import onnxruntime
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import xxhash
 from dotenv import load_dotenv
 from firecrawl import Firecrawl
 from qdrant_client import QdrantClient
@@ -15,11 +27,57 @@ from fastembed import TextEmbedding
 from ollama import chat
 from gtts import gTTS
 
+try:
+    from piper import PiperVoice
+except ImportError:  # local TTS is optional; gTTS is used instead
+    PiperVoice = None
+
 # ======================
 # Setup
 # ======================
 load_dotenv()
 
+# FastEmbed's default model, pinned explicitly
+EMBEDDING_MODEL_NAME = "BAAI/bge-small-en-v1.5"
+
+# Namespace for deterministic point IDs derived from "<url>#<chunk index>"
+POINT_NS = uuid.NAMESPACE_URL
+
+# Local store for chunk text; Qdrant payloads only carry url and chunk_id
+CHUNK_DB_PATH = os.getenv("CHUNK_DB_PATH", "chunks.db")
+
+# Give up on a Firecrawl job that hasn't completed after this long
+CRAWL_TIMEOUT_SECONDS = 300
+
+# TTS backend: "piper" synthesizes locally, "gtts" calls Google's service.
+# Piper falls back to gTTS when the package or voice model is missing, or
+# when synthesis fails.
+TTS_ENGINE = os.getenv("TTS_ENGINE", "piper")
+PIPER_VOICE_DIR = os.getenv("PIPER_VOICE_DIR", "voices")
+PIPER_VOICES = {
+    "default": "en_US-amy-medium",
+    "female": "en_US-amy-medium",
+    "male": "en_US-ryan-medium"
+}
+# (MIME type, file extension) of the audio each engine produces
+AUDIO_FORMATS = {
+    "piper": ("audio/wav", "wav"),
+    "gtts": ("audio/mp3", "mp3")
+}
+
+# Upper bound for the on-disk TTS cache
+TTS_CACHE_MAX_BYTES = 100 * 1024 * 1024
+
+# Splits streamed LLM output into sentences for incremental TTS
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Search the quantized vectors, then rescore an oversampled candidate set
+# with the original vectors to keep recall; hnsw_ef sets the search beam width
+SEARCH_PARAMS = models.SearchParams(
+    hnsw_ef=64,
+    quantization=models.QuantizationSearchParams(ignore=False, rescore=True, oversampling=2.0)
+)
+
 
 def init_session_state():
     defaults = {
@@ -30,6 +88,7 @@ def init_session_state():
         "doc_url": "",
         "setup_complete": False,
         "client": None,
+        "client_url": "",
         "embedding_model": None,
         "selected_voice": "default"
     }
@@ -46,32 +105,52 @@ def sidebar_config():
         st.session_state.qdrant_url = st.text_input("Qdrant URL", value=st.session_state.qdrant_url)
         st.session_state.qdrant_api_key = st.text_input("Qdrant API Key", value=st.session_state.qdrant_api_key, type="password")
         st.session_state.firecrawl_api_key = st.text_input("Firecrawl API Key", value=st.session_state.firecrawl_api_key, type="password")
-        st.session_state.doc_url = st.text_input("Documentation URL", value=st.session_state.doc_url, placeholder="https://docs.example.com")
+        st.session_state.doc_url = st.text_input("Documentation URL", value=st.session_state.doc_url, placeholder="https://docs.example.com", help="Separate multiple URLs with commas")
 
         st.markdown("---")
         st.session_state.selected_voice = st.selectbox(
             "Select Voice",
             options=["default", "female", "male"],
             index=0,
-            help="Choose the voice for the audio response (gTTS)"
+            help="Choose the voice for the audio response"
         )
 
         if st.button("Initialize System", type="primary"):
             if all([st.session_state.qdrant_url, st.session_state.qdrant_api_key, st.session_state.firecrawl_api_key, st.session_state.doc_url]):
                 try:
-                    st.markdown("🔄 Setting up Qdrant connection...")
-                    client, embedding_model = setup_qdrant_collection(
-                        st.session_state.qdrant_url, st.session_state.qdrant_api_key
-                    )
-                    st.session_state.client = client
-                    st.session_state.embedding_model = embedding_model
-                    st.success("✅ Qdrant setup complete!")
-
-                    st.markdown("🔄 Crawling documentation pages...")
-                    pages = crawl_documentation(st.session_state.firecrawl_api_key, st.session_state.doc_url)
-                    st.success(f"✅ Crawled {len(pages)} documentation pages!")
+                    st.markdown("🔄 Setting up Qdrant connection and crawling documentation pages...")
+                    doc_urls = [u.strip() for u in st.session_state.doc_url.split(",") if u.strip()]
+
+                    # Load the cached embedder here so workers only ever hit the cache
+                    _get_embedder()
+
+                    # Collection setup and crawling are independent, so overlap their I/O.
+                    # Workers get this script's context so Streamlit caches work in them.
+                    executor = ThreadPoolExecutor(max_workers=2, initializer=add_script_run_ctx, initargs=(None, get_script_run_ctx()))
+                    try:
+                        qdrant_future = executor.submit(
+                            setup_qdrant_collection, st.session_state.qdrant_url, st.session_state.qdrant_api_key
+                        )
+                        pages_future = executor.submit(crawl_documentation, st.session_state.firecrawl_api_key, doc_urls)
+
+                        client, embedding_model = qdrant_future.result()
+                        st.session_state.client = client
+                        # The sidebar field can change later; remember what the client points at
+                        st.session_state.client_url = st.session_state.qdrant_url
+                        st.session_state.embedding_model = embedding_model
+                        st.success("✅ Qdrant setup complete!")
+
+                        pages = pages_future.result()
+                        st.success(f"✅ Crawled {len(pages)} documentation pages!")
+                    except Exception:
+                        # Report the failure now instead of waiting for the other job
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        raise
+                    executor.shutdown()
 
                     store_embeddings(client, embedding_model, pages, "docs_embeddings")
+                    # Cached hits may come from a different Qdrant instance or older docs
+                    query_knowledge_base.clear()
                     st.session_state.setup_complete = True
                     st.success("✅ System initialized successfully!")
 
@@ -81,55 +160,101 @@ def sidebar_config():
                 st.error("Please fill in all the required fields!")
 
 
-def setup_qdrant_collection(qdrant_url: str, qdrant_api_key: str, collection_name: str = "docs_embeddings"):
-    client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
-    embedding_model = TextEmbedding()
-    test_embedding = list(embedding_model.embed(["test"]))[0]
-    embedding_dim = len(test_embedding)
+@st.cache_resource
+def _get_embedder() -> TextEmbedding:
+    # Loading the ONNX model is expensive; keep one instance across reruns
+    providers = ["CPUExecutionProvider"]
+    if "OpenVINOExecutionProvider" in onnxruntime.get_available_providers():
+        providers.insert(0, "OpenVINOExecutionProvider")
 
-    try:
-        client.create_collection(
-            collection_name=collection_name,
-            vectors_config=VectorParams(size=embedding_dim, distance=Distance.COSINE)
+    embedding_model = TextEmbedding(
+        model_name=EMBEDDING_MODEL_NAME,
+        threads=os.cpu_count(),
+        providers=providers
+    )
+    # Warm up the session so the first real query doesn't pay for it
+    list(embedding_model.embed(["warmup"]))
+    return embedding_model
+
+
+def get_quantization_config(quantization: str):
+    if quantization == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    if quantization == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, always_ram=True)
         )
-    except Exception as e:
-        if "already exists" not in str(e):
-            raise e
+    if quantization == "none":
+        return None
+    raise ValueError(f"Unknown quantization: {quantization}")
+
+
+def setup_qdrant_collection(qdrant_url: str, qdrant_api_key: str, collection_name: str = "docs_embeddings", quantization: str = "binary",
+                            hnsw_m: int = 16, hnsw_ef_construct: int = 128, on_disk_payload: bool = True):
+    client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key, prefer_grpc=True, grpc_port=6334)
+    embedding_model = _get_embedder()
+
+    # Reruns against an existing collection don't need the dimension probe below
+    if not client.collection_exists(collection_name):
+        test_embedding = list(embedding_model.embed(["test"]))[0]
+        embedding_dim = len(test_embedding)
+        quantization_config = get_quantization_config(quantization)
+
+        try:
+            client.create_collection(
+                collection_name=collection_name,
+                # Full-precision vectors live on disk; quantized copies stay in RAM
+                vectors_config=VectorParams(size=embedding_dim, distance=Distance.COSINE, on_disk=quantization_config is not None),
+                quantization_config=quantization_config,
+                hnsw_config=models.HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct),
+                # Keep large markdown payloads on disk rather than in RAM
+                on_disk_payload=on_disk_payload
+            )
+        except Exception as e:
+            if "already exists" not in str(e):
+                raise e
+
+    # Re-ingest deletes points by URL, so index that field for filtering; this is
+    # idempotent, so collections created earlier get the index too
+    client.create_payload_index(
+        collection_name=collection_name,
+        field_name="url",
+        field_schema=models.PayloadSchemaType.KEYWORD
+    )
 
     return client, embedding_model
 
 
-def crawl_documentation(firecrawl_api_key: str, url: str, limit: int = 5):
-    firecrawl = Firecrawl(api_key=firecrawl_api_key)
-
-    # Start crawl job
-    job = firecrawl.crawl(url=url, limit=limit)
+async def _crawl_one(firecrawl: Firecrawl, url: str, limit: int) -> List[Dict]:
+    # Start the crawl without waiting for it (crawl() would block until done
+    # with no timeout); the SDK call is blocking, so keep it off the event loop
+    job = await asyncio.to_thread(firecrawl.start_crawl, url=url, limit=limit)
 
-    # Handle the case where crawl returns immediately completed results
-    if hasattr(job, 'status') and job.status == 'completed':
-        # Job is already completed, extract data directly
-        result = job
+    # Handle both return types for job ID: dict or CrawlResponse
+    if isinstance(job, dict):
+        job_id = job.get("id")
     else:
-        # Handle both return types for job ID: dict or CrawlJob
-        if isinstance(job, dict):
-            job_id = job.get("id")
+        job_id = getattr(job, "id", None)
+
+    if not job_id:
+        raise ValueError(f"Could not extract crawl job ID. Got: {job}")
+
+    # Poll until finished, backing off exponentially up to a hard deadline
+    delay = 0.25
+    deadline = time.monotonic() + CRAWL_TIMEOUT_SECONDS
+    while True:
+        result = await asyncio.to_thread(firecrawl.get_crawl_status, job_id)
+        status = getattr(result, "status", None) if not isinstance(result, dict) else result.get("status")
+
+        if status == "completed":
+            break
+        elif status == "failed":
+            raise RuntimeError(f"Crawl failed: {result}")
+        elif time.monotonic() >= deadline:
+            raise TimeoutError(f"Crawl job {job_id} did not complete within {CRAWL_TIMEOUT_SECONDS}s")
         else:
-            job_id = getattr(job, "id", None)
-
-        if not job_id:
-            raise ValueError(f"Could not extract crawl job ID. Got: {job}")
-
-        # Poll until finished
-        while True:
-            result = firecrawl.get_crawl_status(job_id)
-            status = getattr(result, "status", None) if not isinstance(result, dict) else result.get("status")
-
-            if status == "completed":
-                break
-            elif status == "failed":
-                raise RuntimeError(f"Crawl failed: {result}")
-            else:
-                time.sleep(2)  # wait before retrying
+            await asyncio.sleep(delay)  # wait before retrying
+            delay = min(delay * 1.7, 8.0)
 
     # Extract pages
     pages = []
@@ -170,70 +295,334 @@ def crawl_documentation(firecrawl_api_key: str, url: str, limit: int = 5):
     return pages
 
 
-def store_embeddings(client: QdrantClient, embedding_model: TextEmbedding, pages: List[Dict], collection_name: str):
-    for page in pages:
-        embedding = list(embedding_model.embed([page["content"]]))[0]
-        client.upsert(
+async def crawl_documentation_async(firecrawl_api_key: str, urls: List[str], limit: int = 5) -> List[Dict]:
+    firecrawl = Firecrawl(api_key=firecrawl_api_key)
+
+    # Run one crawl job per URL concurrently so their polling waits overlap
+    tasks = [asyncio.create_task(_crawl_one(firecrawl, url, limit)) for url in urls]
+    results = await asyncio.gather(*tasks)
+    return [page for pages in results for page in pages]
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def crawl_documentation(firecrawl_api_key: str, urls: List[str], limit: int = 5) -> List[Dict]:
+    # Cached per (API key, URLs, limit); the TTL picks up doc changes hourly
+    return asyncio.run(crawl_documentation_async(firecrawl_api_key, urls, limit))
+
+
+def _chunk(text: str, size: int = 1600, overlap: int = 200) -> List[str]:
+    # ~400-token character windows so each chunk fits the encoder context
+    if len(text) <= size:
+        return [text]
+    step = size - overlap
+    return [text[start:start + size] for start in range(0, len(text) - overlap, step)]
+
+
+def _chunk_point_id(url: str, chunk_idx: int) -> str:
+    # Deterministic per (url, chunk); store_embeddings clears each crawled URL's
+    # old points first, so re-ingesting also drops chunks that no longer exist
+    return str(uuid.uuid5(POINT_NS, f"{url}#{chunk_idx}"))
+
+
+@st.cache_resource
+def _get_chunk_store():
+    conn = duckdb.connect(CHUNK_DB_PATH)
+    conn.execute("CREATE TABLE IF NOT EXISTS chunks (chunk_id TEXT PRIMARY KEY, url TEXT, content TEXT)")
+    return conn
+
+
+def fetch_chunk_contents(chunk_ids: List[str]) -> Dict[str, str]:
+    if not chunk_ids:
+        return {}
+    placeholders = ", ".join("?" for _ in chunk_ids)
+    # DuckDB connections are not thread-safe; each caller gets its own cursor
+    rows = _get_chunk_store().cursor().execute(
+        f"SELECT chunk_id, content FROM chunks WHERE chunk_id IN ({placeholders})", chunk_ids
+    ).fetchall()
+    return dict(rows)
+
+
+def _delete_pages(client: QdrantClient, collection_name: str, urls: List[str]):
+    # Remove everything previously stored for these URLs so re-ingest replaces it
+    client.delete(
+        collection_name=collection_name,
+        points_selector=models.FilterSelector(
+            filter=models.Filter(must=[models.FieldCondition(key="url", match=models.MatchAny(any=urls))])
+        ),
+        wait=True
+    )
+    placeholders = ", ".join("?" for _ in urls)
+    _get_chunk_store().cursor().execute(f"DELETE FROM chunks WHERE url IN ({placeholders})", urls)
+
+
+def _upsert_chunks(client: QdrantClient, collection_name: str, pages: List[Dict], chunks: List[tuple], vectors: List[np.ndarray]):
+    # Convert the whole batch in one call instead of one .tolist() per vector
+    vector_lists = np.ascontiguousarray(vectors, dtype=np.float32).tolist()
+    chunk_ids = [_chunk_point_id(pages[page_idx]["url"], chunk_idx) for page_idx, chunk_idx, _ in chunks]
+
+    # Chunk text goes to the local store so search responses stay small
+    _get_chunk_store().cursor().executemany(
+        "INSERT OR REPLACE INTO chunks (chunk_id, url, content) VALUES (?, ?, ?)",
+        [(chunk_id, pages[page_idx]["url"], text) for chunk_id, (page_idx, _, text) in zip(chunk_ids, chunks)]
+    )
+
+    points = [
+        models.PointStruct(
+            id=chunk_id,
+            vector=vector,
+            payload={
+                "url": pages[page_idx]["url"],
+                "chunk_id": chunk_id
+            }
+        )
+        for chunk_id, (page_idx, _, _), vector in zip(chunk_ids, chunks, vector_lists)
+    ]
+    client.upsert(collection_name=collection_name, points=points, wait=False)
+
+
+def store_embeddings(client: QdrantClient, embedding_model: TextEmbedding, pages: List[Dict], collection_name: str, batch_size: int = 32, upsert_batch_size: int = 128):
+    # Disable indexing during the bulk load; the collection's own threshold is
+    # restored afterwards so the index is rebuilt once
+    indexing_threshold = client.get_collection(collection_name).config.optimizer_config.indexing_threshold
+    client.update_collection(
+        collection_name=collection_name,
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=0)
+    )
+
+    try:
+        # Dedup below keeps whichever duplicate comes first in crawl order, and
+        # pages can shrink, so stale points for these URLs must go first
+        urls = list({page["url"] for page in pages})
+        if urls:
+            _delete_pages(client, collection_name, urls)
+
+        # Alias URLs and repeated boilerplate produce identical chunks; embed each once
+        chunks = []
+        seen = set()
+        for page_idx, page in enumerate(pages):
+            for chunk_idx, text in enumerate(_chunk(page["content"])):
+                content_hash = xxhash.xxh64_intdigest(text)
+                if content_hash in seen:
+                    continue
+                seen.add(content_hash)
+                chunks.append((page_idx, chunk_idx, text))
+
+        # Embed all chunks in one batched call; vectors are streamed back in order
+        texts = [text for _, _, text in chunks]
+        pending_chunks: List[tuple] = []
+        pending_vectors: List[np.ndarray] = []
+        for chunk, embedding in zip(chunks, embedding_model.embed(texts, batch_size=batch_size)):
+            pending_chunks.append(chunk)
+            pending_vectors.append(embedding)
+            if len(pending_chunks) >= upsert_batch_size:
+                _upsert_chunks(client, collection_name, pages, pending_chunks, pending_vectors)
+                pending_chunks, pending_vectors = [], []
+
+        if pending_chunks:
+            _upsert_chunks(client, collection_name, pages, pending_chunks, pending_vectors)
+    finally:
+        client.update_collection(
             collection_name=collection_name,
-            points=[
-                models.PointStruct(
-                    id=str(uuid.uuid4()),
-                    vector=embedding.tolist(),
-                    payload={
-                        "content": page["content"],
-                        "url": page["url"],
-                        **page["metadata"]
-                    }
-                )
-            ]
+            optimizers_config=models.OptimizersConfigDiff(indexing_threshold=indexing_threshold)
         )
 
 
-def query_knowledge_base(query: str, client: QdrantClient, embedding_model: TextEmbedding, collection_name: str = "docs_embeddings"):
-    query_embedding = list(embedding_model.embed([query]))[0]
-    search_response = client.query_points(
+@functools.lru_cache(maxsize=1024)
+def _embed_query(embedding_model: TextEmbedding, query: str) -> np.ndarray:
+    query_embedding = np.ascontiguousarray(list(embedding_model.embed([query]))[0], dtype=np.float32)
+    # Cached arrays are shared between callers, so make them read-only
+    query_embedding.setflags(write=False)
+    return query_embedding
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def query_knowledge_base(query: str, qdrant_url: str, _client: QdrantClient, _embedding_model: TextEmbedding, collection_name: str = "docs_embeddings"):
+    # The cache is process-wide and underscored arguments are not hashed, so
+    # qdrant_url keeps sessions on different backends from sharing results.
+    # qdrant-client accepts NumPy arrays here, so no list conversion is needed
+    query_embedding = _embed_query(_embedding_model, query)
+    search_response = _client.query_points(
         collection_name=collection_name,
-        query=query_embedding.tolist(),
-        limit=3,
-        with_payload=True
+        query=query_embedding,
+        limit=5,
+        with_payload=["url", "chunk_id"],
+        search_params=SEARCH_PARAMS
     )
     results = search_response.points if hasattr(search_response, "points") else []
     return results
 
 
-def process_query(query: str, client: QdrantClient, embedding_model: TextEmbedding, doc_url: str):
-    results = query_knowledge_base(query, client, embedding_model)
-    if not results:
-        return {"status": "error", "error": "No relevant documents found"}
-
-    context = "Based on the following documentation:\n\n"
-    for result in results:
-        payload = result.payload
-        if not payload:
+def _evict_tts_cache(cache_dir: str, max_bytes: int = TTS_CACHE_MAX_BYTES):
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
             continue
-        url = payload.get("url", doc_url)
-        content = payload.get("content", "")
-        context += f"From {url}:\n{content}\n\n"
+        entries.append((stat.st_atime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    # Drop least recently used files until the cache fits again
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
 
-    context += f"\nUser Question: {query}\n\nPlease provide a clear, concise answer."
+def _piper_model_path(voice: str) -> str:
+    return os.path.join(PIPER_VOICE_DIR, f"{PIPER_VOICES.get(voice, PIPER_VOICES['default'])}.onnx")
 
-    response = chat(
+
+def _select_tts_engine(voice: str) -> str:
+    if TTS_ENGINE == "piper" and PiperVoice is not None and os.path.exists(_piper_model_path(voice)):
+        return "piper"
+    return "gtts"
+
+
+@st.cache_resource
+def _get_piper_voice(model_path: str):
+    return PiperVoice.load(model_path)
+
+
+def _synthesize(text: str, lang: str, engine: str, piper_voice=None) -> bytes:
+    buf = io.BytesIO()
+    if engine == "piper":
+        with wave.open(buf, "wb") as wav_file:
+            piper_voice.synthesize_wav(text, wav_file)
+    else:
+        gTTS(text=text, lang=lang).write_to_fp(buf)
+    return buf.getvalue()
+
+
+def _join_audio(segments: List[bytes], engine: str) -> bytes:
+    if engine != "piper" or not segments:
+        # MP3 frames can be concatenated directly
+        return b"".join(segments)
+
+    # Each WAV segment carries its own header; merge the frames under one
+    out = io.BytesIO()
+    with wave.open(out, "wb") as merged:
+        for i, segment in enumerate(segments):
+            with wave.open(io.BytesIO(segment), "rb") as part:
+                if i == 0:
+                    merged.setparams(part.getparams())
+                merged.writeframes(part.readframes(part.getnframes()))
+    return out.getvalue()
+
+
+def _tts_cached(text: str, voice: str, lang: str, engine: str, piper_voice=None) -> bytes:
+    key = hashlib.sha256(f"{engine}|{lang}|{voice}|{text}".encode()).hexdigest()
+    cache_dir = os.path.join(tempfile.gettempdir(), "tts_cache")
+    path = os.path.join(cache_dir, f"{key}.{AUDIO_FORMATS[engine][1]}")
+
+    try:
+        with open(path, "rb") as f:
+            audio_bytes = f.read()
+        os.utime(path)  # mark as recently used for LRU eviction
+        return audio_bytes
+    except FileNotFoundError:
+        pass
+
+    # Synthesize into memory; the cache write is the only disk touch
+    audio_bytes = _synthesize(text, lang, engine, piper_voice)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(audio_bytes)
+    os.replace(tmp_path, path)
+    _evict_tts_cache(cache_dir)
+    return audio_bytes
+
+
+def _stream_chat(context: str, voice: str, engine: str, piper_voice, executor: ThreadPoolExecutor, audio_jobs: List[tuple]) -> Iterator[str]:
+    stream = chat(
         model="llama3.2:latest",
         messages=[
             {"role": "system", "content": "You are a helpful documentation assistant."},
             {"role": "user", "content": context}
-        ]
+        ],
+        stream=True
     )
 
-    text_response = response["message"]["content"]
-
-    # Generate speech with gTTS
-    tts = gTTS(text=text_response, lang="en")
-    temp_dir = tempfile.gettempdir()
-    audio_path = os.path.join(temp_dir, f"response_{uuid.uuid4()}.mp3")
-    tts.save(audio_path)
+    # Synthesize each sentence in the background as soon as it is complete,
+    # so speech generation overlaps with the rest of the LLM decode
+    pending = ""
+    for chunk in stream:
+        text = chunk["message"]["content"]
+        pending += text
+        *sentences, pending = SENTENCE_END.split(pending)
+        for sentence in sentences:
+            if sentence.strip():
+                audio_jobs.append((sentence, executor.submit(_tts_cached, sentence, voice, "en", engine, piper_voice)))
+        yield text
+
+    if pending.strip():
+        audio_jobs.append((pending, executor.submit(_tts_cached, pending, voice, "en", engine, piper_voice)))
+
+
+def process_query(query: str, qdrant_url: str, client: QdrantClient, embedding_model: TextEmbedding, voice: str = "default", write_stream: Optional[Callable[[Iterator[str]], str]] = None):
+    results = query_knowledge_base(query, qdrant_url, client, embedding_model)
+
+    # Search hits only carry chunk IDs; load their text in one query
+    contents = fetch_chunk_contents([r.payload["chunk_id"] for r in results if r.payload and "chunk_id" in r.payload])
+
+    # Drop hits whose text isn't in the chunk store (points written before it
+    # existed, or a missing chunks.db) rather than sending empty sections
+    hits = [
+        (r.payload.get("url"), contents[r.payload["chunk_id"]])
+        for r in results if r.payload and r.payload.get("chunk_id") in contents
+    ]
+    if not hits:
+        return {"status": "error", "error": "No relevant documents found"}
 
-    return {"status": "success", "text_response": text_response, "audio_path": audio_path, "sources": [r.payload.get("url") for r in results if r.payload]}
+    # Build the prompt with a single join instead of repeated concatenation
+    parts = ["Based on the following documentation:"]
+    # Each hit is attributed to its own URL; hits without one are left unattributed
+    parts.extend(f"From {url}:\n{content}" if url else content for url, content in hits)
+    parts.append(f"\nUser Question: {query}\n\nPlease provide a clear, concise answer.")
+    context = "\n\n".join(parts)
+
+    engine = _select_tts_engine(voice)
+    piper_voice = None
+    if engine == "piper":
+        # Load the cached voice here: TTS workers have no script context, and
+        # the first sentences would otherwise race to load the model
+        try:
+            piper_voice = _get_piper_voice(_piper_model_path(voice))
+        except Exception:
+            engine = "gtts"
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        audio_jobs: List[tuple] = []  # (sentence, Future[bytes]) in sentence order
+        text_stream = _stream_chat(context, voice, engine, piper_voice, executor, audio_jobs)
+        # Let the UI render tokens as they arrive; otherwise just collect them
+        text_response = write_stream(text_stream) if write_stream is not None else "".join(text_stream)
+
+        try:
+            segments = [future.result() for _, future in audio_jobs]
+        except Exception:
+            if engine != "piper":
+                raise
+            # WAV and MP3 segments can't be mixed, so redo every sentence with gTTS
+            engine = "gtts"
+            segments = [_tts_cached(sentence, voice, "en", engine) for sentence, _ in audio_jobs]
+
+        # Stitch the per-sentence audio back together in sentence order
+        audio_bytes = _join_audio(segments, engine)
+    audio_format, audio_extension = AUDIO_FORMATS[engine]
+
+    return {"status": "success", "text_response": text_response, "audio_bytes": audio_bytes, "audio_format": audio_format, "audio_extension": audio_extension, "sources": list(dict.fromkeys(url for url, _ in hits if url))}
+
+
+def render_text_stream(text_stream: Iterator[str]) -> str:
+    st.markdown("### 📖 Text Response")
+    return st.write_stream(text_stream)
 
 
 def run_streamlit():
@@ -248,22 +637,18 @@ def run_streamlit():
 
     if query and st.session_state.setup_complete:
         with st.spinner("Processing your query..."):
-            result = process_query(query, st.session_state.client, st.session_state.embedding_model, st.session_state.doc_url)
+            result = process_query(query, st.session_state.client_url, st.session_state.client, st.session_state.embedding_model, st.session_state.selected_voice, write_stream=render_text_stream)
 
             if result["status"] == "success":
-                st.markdown("### 📖 Text Response")
-                st.write(result["text_response"])
-
                 st.markdown("### 🔊 Audio Response")
-                st.audio(result["audio_path"], format="audio/mp3")
-
-                with open(result["audio_path"], "rb") as audio_file:
-                    st.download_button(
-                        label="📥 Download Audio Response",
-                        data=audio_file,
-                        file_name="voice_response.mp3",
-                        mime="audio/mp3"
-                    )
+                st.audio(result["audio_bytes"], format=result["audio_format"])
+
+                st.download_button(
+                    label="📥 Download Audio Response",
+                    data=result["audio_bytes"],
+                    file_name=f"voice_response.{result['audio_extension']}",
+                    mime=result["audio_format"]
+                )
 
                 st.markdown("### 📚 Sources")
                 for src in result["sources"]: